@@ -18,10 +18,8 @@
 """
 
 from contextlib import suppress
-import os
 import time
 import wx
-import tones
 import api
 import globalPluginHandler
 import appModuleHandler
@@ -32,22 +30,32 @@ import speech
 import speech.speech
 import controlTypes
 import globalCommands
-import browseMode
 import config
+from config import post_configSave, post_configReset, post_configProfileSwitch
 from speech.sayAll import SayAllHandler
 
-from .handler import AudioThemesHandler, SpecialProps
+from .handler import AudioThemesHandler, SpecialProps, audiotheme_changed
 from .settings import AudioThemesSettingsPanel
-from .studio import AudioThemesStudioStartupDialog
 
 import addonHandler
 
 addonHandler.initTranslation()
 
+# Minimum interval between two mouse move sounds, in nanoseconds
+MOUSE_MOVE_INTERVAL_NS = 50_000_000
+# Roles of objects that getOrder can report as first or last (list items, chrole=15)
+ORDERABLE_ROLES = frozenset({controlTypes.Role.LISTITEM})
+
 
 class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
-    browser_apps = ["firefox", "iexplore", "chrome", "opera", "edge"]
+    browser_apps = frozenset(("firefox", "iexplore", "chrome", "opera", "edge"))
+    _config_actions = (
+        post_configSave,
+        post_configReset,
+        post_configProfileSwitch,
+        audiotheme_changed,
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -59,64 +67,96 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         speech.speech.getPropertiesSpeech = self._hook_getPropertiesSpeech
         # Normal instantiate
         self.handler = AudioThemesHandler()
+        # Whether role speech may be suppressed, refreshed whenever the configuration changes
+        self._suppress_enabled = False
+        self._update_suppress_state()
+        for action in self._config_actions:
+            action.register(self._update_suppress_state)
         gui.settingsDialogs.NVDASettingsDialog.categoryClasses.append(
             AudioThemesSettingsPanel
         )
         self._previous_mouse_object = None
-        # Track when focus event played a sound (for deduplication)
+        self._last_mouse_ns = 0
+        # Track when focus event played a sound (for deduplication), in monotonic nanoseconds
         self._last_focus_sound_time = 0
         # Track last object identity in browse mode (role + name for deduplication)
         self._last_browse_object_id = None
-        # Add the menu item for the audio themes studio
-        self.studioMenuItem = gui.mainFrame.sysTrayIcon.menu.Insert(
-            2,
-            wx.ID_ANY,
-            # Translators: label for the audio themes studio menu item
-            _("&Audio Themes Studio"),
-        )
+        # (id(focus), treeInterceptor) pair, reset whenever the focus changes
+        self._browse_cache = (None, None)
+        # Add the menu item for the audio themes studio, reusing the one left behind
+        # by a previous instance whose terminate did not complete (plugin reload)
+        menu = gui.mainFrame.sysTrayIcon.menu
+        self.studioMenuItem = getattr(menu, "_audiothemes_studio_item", None)
+        if self.studioMenuItem is None:
+            self.studioMenuItem = menu.Insert(
+                2,
+                wx.ID_ANY,
+                # Translators: label for the audio themes studio menu item
+                _("&Audio Themes Studio"),
+            )
+            menu._audiothemes_studio_item = self.studioMenuItem
+        else:
+            gui.mainFrame.sysTrayIcon.Unbind(wx.EVT_MENU, self.studioMenuItem)
         gui.mainFrame.sysTrayIcon.Bind(
             wx.EVT_MENU, self.on_studio_item_clicked, self.studioMenuItem
         )
 
     def terminate(self):
+        # Each step is guarded on its own, so that one failing never leaves speech
+        # patched or the audio player open
+        speech.speakTextInfo = self.original_speech_speakTextInfo
+        speech.speech.getPropertiesSpeech = self._original_getPropertiesSpeech
+        with suppress(Exception):
+            self.handler.close()
+        for action in self._config_actions:
+            with suppress(Exception):
+                action.unregister(self._update_suppress_state)
         with suppress(Exception):
             gui.settingsDialogs.NVDASettingsDialog.categoryClasses.remove(
                 AudioThemesSettingsPanel
             )
+        with suppress(Exception):
+            gui.mainFrame.sysTrayIcon.Unbind(wx.EVT_MENU, self.studioMenuItem)
+        with suppress(Exception):
             gui.mainFrame.sysTrayIcon.menu.RemoveItem(self.studioMenuItem)
-            speech.speakTextInfo = self.original_speech_speakTextInfo
-            speech.speech.getPropertiesSpeech = self._original_getPropertiesSpeech
-            self.handler.close()
+        with suppress(Exception):
+            del gui.mainFrame.sysTrayIcon.menu._audiothemes_studio_item
 
     def _is_in_browse_mode(self):
         """Check if we're currently in browse mode (virtual cursor active)."""
+        focus = api.getFocusObject()
+        if focus is None:
+            return False
+        focus_id, ti = self._browse_cache
+        if focus_id != id(focus):
+            ti = getattr(focus, 'treeInterceptor', None)
+            # The tree interceptor may be created after the focus event, so only cache a hit
+            if ti is not None:
+                self._browse_cache = (id(focus), ti)
+        if ti is None:
+            return False
+        # Browse mode = treeInterceptor active and not in passThrough (focus) mode
+        # passThrough is read every time, since NVDA+space toggles it without a focus change
+        return not getattr(ti, 'passThrough', True)
+
+    def _update_suppress_state(self, *args, **kwargs):
+        """Cache the settings used by the speech hooks, refreshed whenever the configuration changes."""
         try:
-            focus = api.getFocusObject()
-            if focus and hasattr(focus, 'treeInterceptor'):
-                ti = focus.treeInterceptor
-                if ti and hasattr(ti, 'passThrough'):
-                    # Browse mode = treeInterceptor active and not in passThrough (focus) mode
-                    return not ti.passThrough
+            conf = config.conf["audiothemes"]
+            self._cfg_enable = conf["enable_audio_themes"]
+            self._cfg_use_in_say_all = conf["use_in_say_all"]
+            self._cfg_speak_roles = conf["speak_roles"]
         except Exception:
-            pass
-        return False
+            self._cfg_enable = self._cfg_use_in_say_all = self._cfg_speak_roles = False
+        # Don't suppress if audio themes are disabled or if speak_roles is enabled
+        self._suppress_enabled = self._cfg_enable and not self._cfg_speak_roles
 
     def _should_suppress_role(self):
         """Check if role speech should be suppressed based on settings."""
-        try:
-            conf = config.conf["audiothemes"]
-            # Don't suppress if audio themes are disabled
-            if not conf["enable_audio_themes"]:
-                return False
-            # Don't suppress during say-all if use_in_say_all is enabled
-            if conf["use_in_say_all"] and SayAllHandler.isRunning():
-                return False
-            # Don't suppress if speak_roles is enabled
-            if conf["speak_roles"]:
-                return False
-            return True
-        except Exception:
-            return False
+        # Don't suppress during say-all if use_in_say_all is enabled
+        return self._suppress_enabled and not (
+            self._cfg_use_in_say_all and SayAllHandler.isRunning()
+        )
 
     def _hook_getPropertiesSpeech(
         self,
@@ -128,10 +168,13 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
         Only suppresses in focus mode - browse mode speaks roles normally.
         """
+        if not self._suppress_enabled:
+            return self._original_getPropertiesSpeech(reason, *args, **kwargs)
         role = kwargs.get("role", None)
         if role is not None:
             # Only suppress if the role has a sound in the active theme
-            if self.handler.active_theme and role in self.handler.active_theme.sounds:
+            active_theme = self.handler.active_theme
+            if active_theme is not None and role in active_theme.sounds_keys:
                 if self._should_suppress_role():
                     # NVDA will not announce roles if we rename it to _role
                     kwargs["_role"] = kwargs["role"]
@@ -143,7 +186,9 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         # Only play in browse mode, and skip if focus just played a sound (avoid duplicates on Tab)
         if self._is_in_browse_mode():
             # Skip if focus event just played a sound (within 0.2 seconds)
-            if time.time() - self._last_focus_sound_time > 0.2:
+            if time.monotonic_ns() - self._last_focus_sound_time > 200_000_000:
+                # NVDAObjectAtStart and the object properties may raise for some text infos,
+                # never let that break speech
                 try:
                     obj = info.NVDAObjectAtStart
                     if obj is not None:
@@ -152,9 +197,9 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
                         if obj is not None:
                             # Track by role + name + location to identify different objects
                             obj_name = getattr(obj, 'name', '') or ''
+                            # location is a RectLTWH named tuple, so it compares by value as is
                             obj_location = getattr(obj, 'location', None)
-                            loc_tuple = tuple(obj_location) if obj_location else None
-                            current_id = (obj.role, obj_name, loc_tuple)
+                            current_id = (obj.role, obj_name, obj_location)
                             if current_id != self._last_browse_object_id:
                                 self._last_browse_object_id = current_id
                                 self.playObject(obj)
@@ -166,6 +211,9 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
         return self.original_speech_speakTextInfo(info, *args, **kwargs)
 
     def on_studio_item_clicked(self, event):
+        # The studio is rarely used, don't load its dialogs until they are needed
+        from .studio import AudioThemesStudioStartupDialog
+
         # Translators: title for the audio themes studio dialog
         with AudioThemesStudioStartupDialog(self, _("Audio Themes Studio")) as dlg:
             dlg.ShowModal()
@@ -180,8 +228,12 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
     )
 
     def event_gainFocus(self, obj, nextHandler):
+        self._browse_cache = (None, None)
+        # Re-evaluate the sound of the focused object, its states (e.g. protected) may have changed
+        with suppress(AttributeError):
+            del obj.snd
         # Focus mode: play sound using focus object position
-        self._last_focus_sound_time = time.time()
+        self._last_focus_sound_time = time.monotonic_ns()
         self.playObject(obj)
         nextHandler()
 
@@ -195,7 +247,11 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
     def event_mouseMove(self, obj, nextHandler, x, y):
         if obj is not self._previous_mouse_object:
             self._previous_mouse_object = obj
-            self.playObject(obj)
+            # Don't flood the player while the mouse sweeps across many objects
+            now = time.monotonic_ns()
+            if now - self._last_mouse_ns > MOUSE_MOVE_INTERVAL_NS:
+                self._last_mouse_ns = now
+                self.playObject(obj)
         nextHandler()
 
     def event_show(self, obj, nextHandler):
@@ -212,22 +268,32 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
     def playObject(self, obj):
         if obj is None:
             return
-        order = self.getOrder(obj)
-        if getattr(obj, "snd", None) is None:
-            if controlTypes.State.PROTECTED in obj.states:
-                obj.snd = SpecialProps.protected
-            elif order:
-                obj.snd = order
+        # Nothing can be played, don't query the accessibility tree on the main thread
+        if not self.handler.enabled or self.handler.active_theme is None:
+            return
+        # The computed sound is remembered on the object itself
+        snd = getattr(obj, "snd", None)
+        if snd is None:
+            # states may have to query the accessibility API, read it only once
+            states = obj.states
+            if controlTypes.State.PROTECTED in states:
+                snd = SpecialProps.protected
             else:
-                obj.snd = obj.role
-        self.handler.play_queued(obj, obj.snd)
+                order = self.getOrder(obj) if obj.role in ORDERABLE_ROLES else None
+                snd = order if order else obj.role
+            obj.snd = snd
+        self.handler.play_queued(obj, snd)
 
     def getOrder(self, obj, parrole=14, chrole=15):
-        if obj.parent and obj.parent.role != parrole:
+        # Each of parent, previous and next may be a cross-process call, fetch them once
+        parent = obj.parent
+        if parent is None or parent.role != parrole:
             return None
-        if (obj.previous is None) or (obj.previous.role != chrole):
+        previous = obj.previous
+        if previous is None or previous.role != chrole:
             return SpecialProps.first
-        elif (obj.next is None) or (obj.next.role != chrole):
+        following = obj.next
+        if following is None or following.role != chrole:
             return SpecialProps.last
 
     __gestures = {"kb:nvda+tab": "speakObject"}
@@ -7,11 +7,16 @@
 import os
 import time
 import threading
+import collections
+from contextlib import suppress
 import dataclasses
+import functools
+import itertools
 import wave
-import struct
+from array import array
 
 import config
+import core
 import nvwave
 import NVDAObjects
 import synthDriverHandler
@@ -24,9 +29,48 @@ except ImportError:
 from . import steam_audio
 
 
-def clamp(value, min_value, max_value):
-    """Clamp value between min and max."""
-    return max(min(value, max_value), min_value)
+# Identical queued sounds submitted within this window (nanoseconds) are played once
+QUEUED_COALESCE_NS = 5_000_000
+# Maximum number of pending play requests, the oldest ones are dropped (and logged) beyond that
+REQUEST_QUEUE_SIZE = 8
+# Window message sent when the display resolution changes
+WM_DISPLAYCHANGE = 0x007E
+
+
+@functools.lru_cache(maxsize=256)
+def _decode_wav(filename, mtime_ns):
+    """Decode a WAV file into float32 mono samples, and 16-bit ones for playing without HRTF.
+
+    Cached on the file's path and modification time, so a sound is decoded once
+    until the file changes. The returned dict is shared: callers must not modify it.
+    """
+    with wave.open(filename, "rb") as wav_file:
+        frames = wav_file.readframes(wav_file.getnframes())
+        sample_width = wav_file.getsampwidth()
+        channels = wav_file.getnchannels()
+        sample_rate = wav_file.getframerate()
+
+        # Decode the raw frames in one go (WAV data is little-endian, like Windows)
+        if sample_width == 2:  # 16-bit
+            samples = array("h", frames)
+        elif sample_width == 1:  # 8-bit, unsigned
+            samples = array("B", frames)
+        else:
+            raise ValueError(f"Unsupported sample width: {sample_width}")
+
+        if sample_width == 1:
+            samples = array("h", [(s - 128) << 8 for s in samples])
+
+        # Mix stereo down to mono, averaging both channels with integer arithmetic
+        if channels == 2:
+            samples = array(
+                "h", [(left + right) >> 1 for left, right in zip(samples[::2], samples[1::2])]
+            )
+
+        # Steam Audio takes floats, convert once here rather than on every play
+        float_samples = array("f", [s / 32768.0 for s in samples])
+
+        return {"data": float_samples, "pcm16": samples, "sample_rate": sample_rate}
 
 
 @dataclasses.dataclass
@@ -52,6 +96,7 @@ class SteamAudioPlayer:
             raise RuntimeError("Steam Audio initialization failed")
 
         # Configure default reverb settings
+        self._use_reverb_cached = True
         self._configure_reverb()
 
         # Initialize WavePlayer for audio output (stereo, 44100Hz, 16-bit)
@@ -61,25 +106,81 @@ class SteamAudioPlayer:
         self._last_played_object = None
         self._last_played_time = 0
         self._last_played_sound = None
-        self._wave_player_lock = threading.Lock()
-        self._sound_generation = 0
+        self._last_queued = (None, None, 0)
+        # Generation of the latest interrupting sound, only advanced on the main thread.
+        # The worker drops interrupting sounds whose generation is no longer the latest.
+        self._generations = itertools.count(1)
+        self._latest_gen = 0
+        self._closed = False
+        # Sounds scaled by the volume, as (samples, gain, scaled samples) by id of their samples.
+        # The volume rarely changes, so each sound is scaled once instead of on every play
+        self._scaled_cache = {}
+
+        # Display parameters (in degrees)
+        self._display_width = 180.0
+        self._display_height_min = -40.0
+        self._display_height_magnitude = 50.0
 
-        # Desktop dimension caching
+        # Desktop dimension caching, refreshed when the display resolution changes
         self._cached_desktop_size = None
-        self._desktop_cache_time = 0
         self._cached_volume = 1.0
         self._update_desktop_cache()
         self._update_volume_cache()
+        synthDriverHandler.synthChanged.register(self._on_synth_changed)
+        core.post_windowMessageReceipt.register(self._on_window_message)
+
+        # Play requests, processed in order by a single audio worker thread
+        self._requests = collections.deque()
+        self._requests_ready = threading.Condition()
+        self._worker = threading.Thread(
+            target=self._audio_worker, name="audiothemes-player", daemon=True
+        )
+        self._worker.start()
+
+    def _submit(self, func, *args):
+        """Queue func(*args) for the audio worker thread, dropping the oldest pending request if full."""
+        with self._requests_ready:
+            if len(self._requests) >= REQUEST_QUEUE_SIZE:
+                # The newest sound is for the object the user just reached, the oldest is stale
+                dropped, _args = self._requests.popleft()
+                log.debug(f"Audio request queue is full, dropping the oldest {dropped.__name__}")
+            self._requests.append((func, args))
+            self._requests_ready.notify()
+
+    def _audio_worker(self):
+        """Run queued play requests until a None request is received."""
+        requests = self._requests
+        while True:
+            with self._requests_ready:
+                while not requests:
+                    self._requests_ready.wait()
+                request = requests.popleft()
+            if request is None:
+                return
+            func, args = request
+            try:
+                func(*args)
+            except Exception as e:
+                log.debug(f"Error in audio worker: {e}")
+
+    def refresh_settings(self):
+        """Re-read the settings cached by the player, call after the configuration changed."""
+        self._configure_reverb()
+        self._update_volume_cache()
+        self._scaled_cache.clear()
 
-        # Display parameters (in degrees)
-        self._display_width = 180.0
-        self._display_height_min = -40.0
-        self._display_height_magnitude = 50.0
+    def _on_synth_changed(self, *args, **kwargs):
+        self._update_volume_cache()
+
+    def _on_window_message(self, msg, **kwargs):
+        if msg == WM_DISPLAYCHANGE:
+            self._update_desktop_cache()
 
     def _configure_reverb(self):
         """Configure reverb settings from config if available."""
         try:
             conf = config.conf.get("audiothemes", {})
+            self._use_reverb_cached = bool(conf.get("use_reverb", True))
             room_size = conf.get("RoomSize", 10) / 100.0
             damping = conf.get("Damping", 100) / 100.0
             wet_level = conf.get("WetLevel", 9) / 100.0
@@ -108,31 +209,11 @@ class SteamAudioPlayer:
             filename: Path to WAV audio file
 
         Returns:
-            dict with 'data' (list of float32 samples) and 'sample_rate'
+            dict with 'data' (array of float32 samples), 'pcm16' (the same
+            samples as an array of int16) and 'sample_rate'
         """
         try:
-            with wave.open(filename, "rb") as wav_file:
-                frames = wav_file.readframes(wav_file.getnframes())
-                sample_width = wav_file.getsampwidth()
-                channels = wav_file.getnchannels()
-                sample_rate = wav_file.getframerate()
-
-                # Convert to float32 samples
-                if sample_width == 2:  # 16-bit
-                    samples = struct.unpack(f"<{len(frames) // 2}h", frames)
-                    float_samples = [s / 32768.0 for s in samples]
-                elif sample_width == 1:  # 8-bit
-                    samples = struct.unpack(f"<{len(frames)}B", frames)
-                    float_samples = [(s - 128) / 128.0 for s in samples]
-                else:
-                    raise ValueError(f"Unsupported sample width: {sample_width}")
-
-                # Convert to mono if stereo
-                if channels == 2:
-                    float_samples = [float_samples[i] for i in range(0, len(float_samples), 2)]
-
-                return {"data": float_samples, "sample_rate": sample_rate}
-
+            return _decode_wav(filename, os.stat(filename).st_mtime_ns)
         except Exception as e:
             log.error(f"Failed to load audio file {filename}: {e}")
             return None
@@ -140,10 +221,10 @@ class SteamAudioPlayer:
     def _compute_volume(self):
         """Compute volume based on settings."""
         if not self.use_synth_volume:
-            return clamp(self.volume / 100.0, 0.0, 1.0)
+            return max(0.0, min(1.0, self.volume / 100.0))
         driver = synthDriverHandler.getSynth()
         volume = getattr(driver, "volume", 100) / 100.0
-        volume = clamp(volume, 0.0, 1.0)
+        volume = max(0.0, min(1.0, volume))
         # Boost volume slightly when using HRTF (3D audio)
         return volume + 0.25 if self.audio3d else volume
 
@@ -152,20 +233,21 @@ class SteamAudioPlayer:
         self._cached_volume = self._compute_volume()
 
     def _update_desktop_cache(self):
-        """Update cached desktop dimensions."""
+        """Update cached desktop dimensions and the screen to angle coefficients."""
         try:
             desktop = NVDAObjects.api.getDesktopObject()
             self._cached_desktop_size = (desktop.location[2], desktop.location[3])
-            self._desktop_cache_time = time.time()
         except Exception:
             self._cached_desktop_size = (1920, 1080)  # Fallback
-            self._desktop_cache_time = time.time()
 
-    def _get_desktop_size(self):
-        """Get desktop dimensions, refreshing cache if stale (>5 seconds)."""
-        if time.time() - self._desktop_cache_time > 5.0:
-            self._update_desktop_cache()
-        return self._cached_desktop_size
+        # angle_x = (x - w / 2) / w * display_width
+        # angle_y = (h - y) / h * height_magnitude + height_min
+        width, height = self._cached_desktop_size
+        self._half_w = width * 0.5
+        self._half_h = height * 0.5
+        self._x_scale = self._display_width / width
+        self._y_scale = -self._display_height_magnitude / height
+        self._y_bias = self._display_height_magnitude + self._display_height_min
 
     def play(self, obj, sound, role=None):
         """Play a sound with 3D positioning based on object location.
@@ -190,17 +272,10 @@ class SteamAudioPlayer:
         if params is None:
             return
 
-        # Play in background thread (interrupts previous sound for responsive navigation)
-        self._sound_generation += 1
-        my_generation = self._sound_generation
-
-        def play_async():
-            try:
-                self._play_sound_async(params, my_generation)
-            except Exception as e:
-                log.debug(f"Error in async playback: {e}")
-
-        threading.Thread(target=play_async, daemon=True).start()
+        # Play on the worker thread (interrupts previous sound for responsive navigation)
+        self._latest_gen = generation = next(self._generations)
+        self._stop_playback()
+        self._submit(self._play_sound_common, params, generation, True)
 
     def play_queued(self, obj, sound, role=None):
         """Play a sound without interrupting current playback.
@@ -215,132 +290,107 @@ class SteamAudioPlayer:
         if sound is None:
             return
 
+        # Events fired back to back for the same object (e.g. focus and document load)
+        # would otherwise synthesize and queue the very same sound twice
+        now = time.monotonic_ns()
+        last_obj, last_sound, last_time = self._last_queued
+        if obj is last_obj and sound is last_sound and now - last_time < QUEUED_COALESCE_NS:
+            return
+        self._last_queued = (obj, sound, now)
+
         # Extract object properties on main thread (COM threading requirement)
         params = self._extract_sound_params(obj, sound)
         if params is None:
             return
 
-        # Play in background thread (queued, doesn't interrupt)
-        def play_async():
-            try:
-                self._play_sound_queued(params)
-            except Exception as e:
-                log.debug(f"Error in queued playback: {e}")
-
-        threading.Thread(target=play_async, daemon=True).start()
+        # Play on the worker thread (queued, doesn't interrupt)
+        self._submit(self._play_sound_common, params, None, False)
 
     def _extract_sound_params(self, obj, sound):
         """Extract parameters needed for sound playback from NVDA object.
 
         Must be called from main thread due to COM threading requirements.
         """
-        # Get coordinate bounds of desktop
-        desktop_max_x, desktop_max_y = self._get_desktop_size()
-
         # Get location of the object (handle None objects - play centered)
         obj_location = getattr(obj, 'location', None) if obj else None
         if self.audio3d and obj_location is not None:
-            obj_x = obj_location[0] + (obj_location[2] / 2.0)
-            obj_y = obj_location[1] + (obj_location[3] / 2.0)
+            obj_x = obj_location[0] + obj_location[2] * 0.5
+            obj_y = obj_location[1] + obj_location[3] * 0.5
         else:
             # Objects without location are centered
-            obj_x = desktop_max_x / 2.0
-            obj_y = desktop_max_y / 2.0
+            obj_x = self._half_w
+            obj_y = self._half_h
 
-        # Scale object position to audio display
-        angle_x = ((obj_x - desktop_max_x / 2.0) / desktop_max_x) * self._display_width
-        percent = (desktop_max_y - obj_y) / desktop_max_y
-        angle_y = self._display_height_magnitude * percent + self._display_height_min
+        # Scale object position to audio display, with the coefficients precomputed
+        # from the desktop size
+        angle_x = (obj_x - self._half_w) * self._x_scale
+        angle_y = obj_y * self._y_scale + self._y_bias
 
-        # Clamp angles to valid ranges
-        angle_x = clamp(angle_x, -90.0, 90.0)
-        angle_y = clamp(angle_y, -90.0, 90.0)
+        # Clamp angles to valid ranges, on-screen objects are always within them
+        if not -90.0 <= angle_x <= 90.0:
+            angle_x = -90.0 if angle_x < -90.0 else 90.0
+        if not -90.0 <= angle_y <= 90.0:
+            angle_y = -90.0 if angle_y < -90.0 else 90.0
 
+        # Without 3D audio the HRTF is skipped, and the 16-bit samples are played as they are
         return {
-            "sound_data": sound["data"],
+            "spatialize": self.audio3d,
+            "sound_data": sound["data"] if self.audio3d else sound["pcm16"],
             "angle_x": angle_x,
             "angle_y": angle_y,
             "volume": self._cached_volume,
         }
 
-    def _play_sound_async(self, params, generation):
-        """Process and play sound on background thread."""
-        sound_data = params["sound_data"]
-        angle_x = params["angle_x"]
-        angle_y = params["angle_y"]
-        volume = params["volume"]
+    def _play_sound_common(self, params, generation, interrupt):
+        """Process and play a sound on the worker thread.
 
-        # Adjust volume
-        adjusted_audio = [sample * volume for sample in sound_data]
+        Interrupting sounds stop the current playback and are dropped once a newer
+        sound has been requested (generation). Queued sounds play one after another.
+        The worker is the only thread feeding the wave player, play() and play_file()
+        also stop it when submitting, so that a sound still being fed is cut short.
+        """
+        # Skip the processing altogether if a newer sound was requested meanwhile
+        if interrupt and generation != self._latest_gen:
+            return
 
-        # Process with Steam Audio for 3D positioning
-        processed_audio = self.steam_audio.process_sound(
-            adjusted_audio, angle_x, angle_y
-        )
-        if not processed_audio:
+        # Process with Steam Audio for 3D positioning, the HRTF is skipped when 3D audio is off
+        if params["spatialize"]:
+            samples = self._scaled(
+                params["sound_data"], params["volume"], steam_audio.scale_samples
+            )
+            final_audio = self.steam_audio.process_sound(
+                samples, params["angle_x"], params["angle_y"]
+            )
+        else:
+            final_audio = self._scaled(
+                params["sound_data"], params["volume"], steam_audio.duplicate_to_stereo
+            )
+        if not final_audio:
             log.debug("Failed to process sound with Steam Audio")
             return
 
         # Apply reverb if enabled
-        final_audio = processed_audio
-        if self.use_reverb:
-            try:
-                conf = config.conf.get("audiothemes", {})
-                if conf.get("use_reverb", True):
-                    reverb_audio = self.steam_audio.apply_reverb(processed_audio)
-                    if reverb_audio:
-                        final_audio = reverb_audio
-            except Exception:
-                pass
-
-        # Check if this sound has been superseded
-        if generation != self._sound_generation:
-            return
-
-        # Stop previous sound and play new one
-        self.wave_player.stop()
+        if self.use_reverb and self._use_reverb_cached:
+            final_audio = self.steam_audio.apply_reverb(final_audio) or final_audio
 
-        with self._wave_player_lock:
-            if generation != self._sound_generation:
-                return
-            self.wave_player.feed(final_audio)
-
-    def _play_sound_queued(self, params):
-        """Process and queue sound without interrupting current playback.
-
-        Sounds are queued and play one after another instead of interrupting.
-        """
-        sound_data = params["sound_data"]
-        angle_x = params["angle_x"]
-        angle_y = params["angle_y"]
-        volume = params["volume"]
-
-        # Adjust volume
-        adjusted_audio = [sample * volume for sample in sound_data]
-
-        # Process with Steam Audio for 3D positioning
-        processed_audio = self.steam_audio.process_sound(
-            adjusted_audio, angle_x, angle_y
-        )
-        if not processed_audio:
-            log.debug("Failed to process sound with Steam Audio")
+        if self._closed:
             return
-
-        # Apply reverb if enabled
-        final_audio = processed_audio
-        if self.use_reverb:
-            try:
-                conf = config.conf.get("audiothemes", {})
-                if conf.get("use_reverb", True):
-                    reverb_audio = self.steam_audio.apply_reverb(processed_audio)
-                    if reverb_audio:
-                        final_audio = reverb_audio
-            except Exception:
-                pass
-
-        # Queue the sound (no stop() call - sounds play sequentially)
-        with self._wave_player_lock:
-            self.wave_player.feed(final_audio)
+        if interrupt:
+            # Check if this sound has been superseded, then stop previous sound and play new one
+            if generation != self._latest_gen:
+                return
+            self.wave_player.stop()
+        # Each sound is fed its own bytes: WinMM wave players keep reading from the
+        # buffer after feed returns, so it must not be reused for the next sound
+        self.wave_player.feed(final_audio)
+
+    def _scaled(self, samples, gain, scale):
+        """Return scale(samples, gain), computed once per sound until the volume changes."""
+        entry = self._scaled_cache.get(id(samples))
+        if entry is None or entry[0] is not samples or entry[1] != gain:
+            entry = (samples, gain, scale(samples, gain))
+            self._scaled_cache[id(samples)] = entry
+        return entry[2]
 
     def play_file(self, filepath):
         """Play an audio file directly (for theme editor preview).
@@ -352,22 +402,26 @@ class SteamAudioPlayer:
         if sound is None:
             return
 
-        self._sound_generation += 1
-        my_generation = self._sound_generation
+        self._latest_gen = generation = next(self._generations)
+        self._stop_playback()
+        self._submit(self._play_file_async, sound, generation)
 
-        def play_async():
-            try:
-                # Play centered (no 3D positioning for preview)
-                processed = self.steam_audio.process_sound(sound["data"], 0.0, 0.0)
-                if processed and my_generation == self._sound_generation:
-                    self.wave_player.stop()
-                    with self._wave_player_lock:
-                        if my_generation == self._sound_generation:
-                            self.wave_player.feed(processed)
-            except Exception as e:
-                log.debug(f"Error playing file: {e}")
+    def _stop_playback(self):
+        """Stop the current sound right away, even while the worker is blocked feeding it."""
+        if self._closed:
+            return
+        try:
+            self.wave_player.stop()
+        except Exception as e:
+            log.debug(f"Error stopping playback: {e}")
 
-        threading.Thread(target=play_async, daemon=True).start()
+    def _play_file_async(self, sound, generation):
+        """Play a sound centered, without volume or reverb, on the worker thread."""
+        # Play centered (no 3D positioning for preview)
+        processed = self.steam_audio.process_sound(sound["data"], 0.0, 0.0)
+        if processed and not self._closed and generation == self._latest_gen:
+            self.wave_player.stop()
+            self.wave_player.feed(processed)
 
     def close(self):
         """Clean up resources.
@@ -375,9 +429,22 @@ class SteamAudioPlayer:
         Note: Does NOT clean up Steam Audio since it's a shared singleton.
         Steam Audio cleanup happens only when the main plugin terminates.
         """
+        self._closed = True
+        with suppress(Exception):
+            synthDriverHandler.synthChanged.unregister(self._on_synth_changed)
+        with suppress(Exception):
+            core.post_windowMessageReceipt.unregister(self._on_window_message)
+        worker = getattr(self, "_worker", None)
+        if worker is not None:
+            # Drop pending sounds and stop the worker
+            with self._requests_ready:
+                self._requests.clear()
+                self._requests.append(None)
+                self._requests_ready.notify()
+            if worker.is_alive() and worker is not threading.current_thread():
+                worker.join(timeout=1.0)
         try:
-            with self._wave_player_lock:
-                self.wave_player.close()
+            self.wave_player.close()
         except Exception:
             pass
 
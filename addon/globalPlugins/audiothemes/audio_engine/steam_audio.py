@@ -5,8 +5,8 @@ Provides 3D audio positioning, reverb, and 16-bit sample output
 
 import ctypes
 import os
-import struct
 import threading
+from array import array
 from ctypes import c_bool, c_int, c_float, POINTER, byref
 
 try:
@@ -19,18 +19,27 @@ _steam_audio_mutex = threading.Lock()
 
 # Keep references to loaded DLLs to prevent unloading
 _loaded_dlls = []
+# Directories added to the DLL search path, with the handles returned by os.add_dll_directory
+_dll_directories = {}
+_preload_lock = threading.Lock()
+
+# Initial size of the reusable reverb input buffer, in frames of frame_size stereo samples
+_INPUT_BUFFER_FRAMES = 16
 
 
 def _preload_dependencies(addon_dir):
-	"""Pre-load dependency DLLs before loading steam_audio.dll"""
-	global _loaded_dlls
+	"""Pre-load dependency DLLs before loading steam_audio.dll
 
+	Only the first successful call loads them, later calls return immediately.
+	"""
 	phonon_path = os.path.join(addon_dir, "phonon.dll")
-	if os.path.exists(phonon_path):
+	with _preload_lock:
+		if _loaded_dlls or not os.path.exists(phonon_path):
+			return
 		try:
 			# Add the addon directory to the DLL search path
-			if hasattr(os, 'add_dll_directory'):
-				os.add_dll_directory(addon_dir)
+			if hasattr(os, 'add_dll_directory') and addon_dir not in _dll_directories:
+				_dll_directories[addon_dir] = os.add_dll_directory(addon_dir)
 
 			# Pre-load phonon.dll
 			phonon_dll = ctypes.CDLL(phonon_path)
@@ -50,6 +59,8 @@ class SteamAudio:
 		"""
 		self.dll = None
 		self.initialized = False
+		# Scratch objects are per thread, so that only the DLL call itself needs the mutex
+		self._thread_local = threading.local()
 
 		if dll_path is None:
 			# Look for DLL in the parent directory (audiothemes/)
@@ -183,13 +194,79 @@ class SteamAudio:
 
 		return success
 
-	def process_sound(self, input_buffer, angle_x, angle_y):
+	def _scratch(self):
+		"""Return the calling thread's persistent ctypes scratch objects.
+
+		The output length, output pointer and their byref() wrappers are created once per
+		thread and reused by every call, the input buffer is grown on demand.
+		"""
+		local = self._thread_local
+		if not hasattr(local, "output_length"):
+			local.output_length = c_int()
+			local.output_length_ref = byref(local.output_length)
+			local.output_ptr = POINTER(ctypes.c_int16)()
+			local.output_ptr_ref = byref(local.output_ptr)
+			local.int16_input = (ctypes.c_int16 * (_INPUT_BUFFER_FRAMES * self.frame_size * 2))()
+		return local
+
+	def _int16_input(self, input_buffer):
+		"""Copy int16 sample bytes into the calling thread's input scratch buffer.
+
+		Returns:
+		    tuple: The scratch buffer and the number of samples copied into it
+		"""
+		local = self._scratch()
+		input_length = len(input_buffer) // 2
+		if input_length > len(local.int16_input):
+			local.int16_input = (ctypes.c_int16 * input_length)()
+		ctypes.memmove(local.int16_input, input_buffer, input_length * 2)
+		return local.int16_input, input_length
+
+	def _call_allocating(self, func, *args):
+		"""Call a DLL function that allocates its own output buffer.
+
+		Returns:
+		    bytes: The int16 output samples, or None if the call failed
+		"""
+		local = self._scratch()
+		output_ptr = local.output_ptr
+		output_length = local.output_length
+		output_length.value = 0
+		ctypes.memset(ctypes.addressof(output_ptr), 0, ctypes.sizeof(output_ptr))
+		with _steam_audio_mutex:
+			success = func(*args, local.output_ptr_ref, local.output_length_ref)
+
+		if not success or not output_ptr:
+			return None
+
+		try:
+			# Copy the int16 samples out of the DLL buffer in a single memcpy
+			return ctypes.string_at(output_ptr, output_length.value * 2)
+		except Exception as e:
+			log.error(f"Error processing output buffer: {e}")
+			return None
+		finally:
+			# Free the output buffer (plain delete[], safe without the mutex)
+			self.dll.free_output_sound(output_ptr)
+
+	@staticmethod
+	def _float_input(input_buffer):
+		"""Return a ctypes float array to pass input_buffer to the DLL.
+
+		float32 arrays are handed to the DLL without copying, anything else is converted.
+		"""
+		if isinstance(input_buffer, array) and input_buffer.typecode == "f":
+			return (c_float * len(input_buffer)).from_buffer(input_buffer)
+		return (c_float * len(input_buffer))(*input_buffer)
+
+	def process_sound(self, input_buffer, angle_x, angle_y, gain=1.0):
 		"""Process audio with 3D positioning (without reverb)
 
 		Args:
-		    input_buffer: list of float32 mono audio samples
+		    input_buffer: array('f') of float32 mono audio samples (other sequences are copied)
 		    angle_x: Horizontal angle in degrees (-90 to 90)
 		    angle_y: Vertical angle in degrees (-90 to 90)
+		    gain: Factor applied to the input samples (default: 1.0)
 
 		Returns:
 		    bytes: Stereo 16-bit audio samples as bytes, or None if failed
@@ -198,55 +275,18 @@ class SteamAudio:
 			log.error("Steam Audio not initialized")
 			return None
 
-		# Convert list to ctypes array
-		input_array = (c_float * len(input_buffer))(*input_buffer)
-		input_ptr = ctypes.cast(input_array, POINTER(c_float))
-		input_length = len(input_buffer)
-
-		# Prepare output parameters
-		output_buffer_ptr = POINTER(ctypes.c_int16)()
-		output_length = c_int()
+		# The DLL has no input gain, scale the samples here
+		input_buffer = scale_samples(input_buffer, gain)
 
-		# Call the DLL function
-		with _steam_audio_mutex:
-			success = self.dll.process_sound(
-				input_ptr,
-				input_length,
-				c_float(angle_x),
-				c_float(angle_y),
-				byref(output_buffer_ptr),
-				byref(output_length),
-			)
+		input_array = self._float_input(input_buffer)
+		input_length = len(input_buffer)
 
-		if not success or not output_buffer_ptr:
+		result = self._call_allocating(
+			self.dll.process_sound, input_array, input_length, angle_x, angle_y
+		)
+		if result is None:
 			log.error("Failed to process sound")
-			return None
-
-		try:
-			# Convert output to bytes
-			output_samples = output_length.value
-			if output_samples > 0:
-				# Pack int16 samples into bytes
-				result = struct.pack(
-					f"<{output_samples}h",
-					*[output_buffer_ptr[i] for i in range(output_samples)],
-				)
-
-				# Free the output buffer
-				with _steam_audio_mutex:
-					self.dll.free_output_sound(output_buffer_ptr)
-
-				return result
-			else:
-				return b""
-
-		except Exception as e:
-			log.error(f"Error processing output buffer: {e}")
-			# Make sure to free the buffer even if there's an error
-			if output_buffer_ptr:
-				with _steam_audio_mutex:
-					self.dll.free_output_sound(output_buffer_ptr)
-			return None
+		return result
 
 	def apply_reverb(self, input_buffer):
 		"""Apply reverb to stereo 16-bit audio
@@ -261,70 +301,72 @@ class SteamAudio:
 			log.error("Steam Audio not initialized")
 			return None
 
-		# Convert bytes to int16 array
-		import struct
+		# Copy the bytes into an int16 array
+		input_array, input_length = self._int16_input(input_buffer)
 
-		samples = struct.unpack(f"<{len(input_buffer) // 2}h", input_buffer)
-		input_array = (ctypes.c_int16 * len(samples))(*samples)
-		input_ptr = ctypes.cast(input_array, POINTER(ctypes.c_int16))
-		input_length = len(samples)
+		result = self._call_allocating(self.dll.apply_reverb, input_array, input_length)
+		if result is None:
+			log.error("Failed to apply reverb")
+		return result
 
-		# Prepare output parameters
-		output_buffer_ptr = POINTER(ctypes.c_int16)()
-		output_length = c_int()
+	def __del__(self):
+		"""Cleanup when object is destroyed"""
+		if hasattr(self, "initialized") and self.initialized:
+			self.cleanup()
 
-		# Call the DLL function
-		with _steam_audio_mutex:
-			success = self.dll.apply_reverb(
-				input_ptr, input_length, byref(output_buffer_ptr), byref(output_length)
-			)
 
-		if not success or not output_buffer_ptr:
-			log.error("Failed to apply reverb")
-			return None
+def scale_samples(input_buffer, gain=1.0):
+	"""Scale float32 mono samples by gain.
 
-		try:
-			# Convert output to bytes
-			output_samples = output_length.value
-			if output_samples > 0:
-				# Pack int16 samples into bytes
-				result = struct.pack(
-					f"<{output_samples}h",
-					*[output_buffer_ptr[i] for i in range(output_samples)],
-				)
+	Returns:
+	    array: The float32 samples, input_buffer itself at unity gain
+	"""
+	if gain == 1.0:
+		return input_buffer
+	return array("f", [sample * gain for sample in input_buffer])
 
-				# Free the output buffer
-				with _steam_audio_mutex:
-					self.dll.free_output_sound(output_buffer_ptr)
 
-				return result
-			else:
-				return b""
+def duplicate_to_stereo(input_buffer, gain=1.0):
+	"""Scale 16-bit mono samples by gain and copy them to both channels.
 
-		except Exception as e:
-			log.error(f"Error processing reverb output buffer: {e}")
-			# Make sure to free the buffer even if there's an error
-			if output_buffer_ptr:
-				with _steam_audio_mutex:
-					self.dll.free_output_sound(output_buffer_ptr)
-			return None
+	Args:
+	    input_buffer: array('h') of 16-bit mono audio samples
+	    gain: Factor applied to the samples (default: 1.0)
 
-	def __del__(self):
-		"""Cleanup when object is destroyed"""
-		if hasattr(self, "initialized") and self.initialized:
-			self.cleanup()
+	Returns:
+	    bytes: Stereo 16-bit audio samples
+	"""
+	if gain == 1.0:
+		mono = input_buffer
+	elif gain < 1.0:
+		# Fixed point scaling, attenuating can't overflow so nothing needs clamping
+		factor = int(gain * 32768)
+		mono = array("h", [(sample * factor) >> 15 for sample in input_buffer])
+	else:
+		mono = array(
+			"h", [max(-32768, min(32767, int(sample * gain))) for sample in input_buffer]
+		)
+	# Interleave with slice assignments rather than sample by sample
+	stereo = array("h", bytes(len(mono) * 4))
+	stereo[0::2] = stereo[1::2] = mono
+	return stereo.tobytes()
 
 
 # Global instance for easy access
 _steam_audio_instance = None
+_instance_lock = threading.Lock()
 
 
 def get_steam_audio():
-	"""Get the global Steam Audio instance"""
+	"""Get the global Steam Audio instance, creating it on first use"""
 	global _steam_audio_instance
-	if _steam_audio_instance is None:
-		_steam_audio_instance = SteamAudio()
-	return _steam_audio_instance
+	instance = _steam_audio_instance
+	if instance is None:
+		with _instance_lock:
+			if _steam_audio_instance is None:
+				_steam_audio_instance = SteamAudio()
+			instance = _steam_audio_instance
+	return instance
 
 
 def initialize_steam_audio(sample_rate=44100, frame_size=1024):
@@ -336,6 +378,7 @@ def initialize_steam_audio(sample_rate=44100, frame_size=1024):
 def cleanup_steam_audio():
 	"""Cleanup the global Steam Audio instance"""
 	global _steam_audio_instance
-	if _steam_audio_instance:
-		_steam_audio_instance.cleanup()
-		_steam_audio_instance = None
+	with _instance_lock:
+		if _steam_audio_instance:
+			_steam_audio_instance.cleanup()
+			_steam_audio_instance = None
@@ -5,12 +5,14 @@
 
 from enum import IntEnum
 from collections import OrderedDict
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, asdict, replace
 from zipfile import ZipFile, ZIP_DEFLATED
 from uuid import uuid4
 import os
 import ctypes
 import shutil
+import stat
+import threading
 import copy
 import json
 import config
@@ -85,6 +87,8 @@ class AudioTheme:
     summary: str
     is_active: bool = False
     sounds: dict = field(default_factory=dict)
+    # Frozen copy of the roles in sounds, for fast membership tests in speech hooks
+    sounds_keys: frozenset = field(default=frozenset(), compare=False, repr=False)
     package_path: str = ""  # Path to .atp file for auto-saving
 
     @property
@@ -100,7 +104,7 @@ class AudioTheme:
 
     def todict(self):
         data = asdict(self)
-        for unwanted_key in ("is_active", "directory", "sounds"):
+        for unwanted_key in ("is_active", "directory", "sounds", "sounds_keys"):
             data.pop(unwanted_key)
         # Only include package_path if it has a value
         if not data.get("package_path"):
@@ -117,9 +121,11 @@ class AudioTheme:
             rep_role = self.is_valid_audio_file(path)
             if rep_role is not None:
                 self.sounds[rep_role] = player.make_sound_object(path)
+        self.sounds_keys = frozenset(self.sounds)
 
     def unload(self):
         self.sounds.clear()
+        self.sounds_keys = frozenset()
 
     def deactivate(self):
         """Deactivate this theme"""
@@ -143,6 +149,14 @@ class AudioTheme:
 class AudioThemesHandler:
     """Query and manage audio themes."""
 
+    # Installed themes sorted by name, rebuilt after themes are installed, removed or edited.
+    # Themes may be installed from a background thread, hence the lock.
+    _themes_cache = []
+    _themes_cache_dirty = True
+    _themes_cache_lock = threading.Lock()
+    # Parsed info files by path, with the modification time they were read at
+    _info_cache = {}
+
     def __init__(self):
         config.conf.spec["audiothemes"] = audiothemes_config_defaults
         self.enabled = True
@@ -190,6 +204,7 @@ class AudioThemesHandler:
         self.player.use_synth_volume = user_config["use_synth_volume"]
         self.player.volume = user_config["volume"]
         self.player.use_reverb = user_config.get("use_reverb", True)
+        self.player.refresh_settings()
 
     def play(self, obj, sound):
         if not self.enabled or (self.active_theme is None):
@@ -212,26 +227,49 @@ class AudioThemesHandler:
     def get_theme_from_folder(cls, folderpath):
         expected = os.path.join(THEMES_HOME, folderpath)
         info_file = os.path.join(expected, INFO_FILE_NAME)
-        if os.path.isfile(info_file):
-            info = cls.load_info_file(info_file)
-            return AudioTheme(directory=expected, **info)
+        try:
+            info_stat = os.stat(info_file)
+        except OSError:
+            return
+        if not stat.S_ISREG(info_stat.st_mode):
+            return
+        # Only parse the info file again when it changed
+        cached = cls._info_cache.get(info_file)
+        if cached is None or cached[0] != info_stat.st_mtime_ns:
+            cached = (info_stat.st_mtime_ns, cls.load_info_file(info_file))
+            cls._info_cache[info_file] = cached
+        return AudioTheme(directory=expected, **cached[1])
+
+    @classmethod
+    def get_installed_themes(cls, force=False):
+        """Return the installed themes sorted by name, scanning the themes folder only when needed or forced."""
+        with cls._themes_cache_lock:
+            if force or cls._themes_cache_dirty:
+                themes = (cls.get_theme_from_folder(folder) for folder in os.listdir(THEMES_HOME))
+                cls._themes_cache = sorted(theme for theme in themes if theme is not None)
+                cls._themes_cache_dirty = False
+            # Callers load, deactivate and edit the themes they get, never hand out the cached ones
+            return [replace(theme, sounds={}) for theme in cls._themes_cache]
 
     @classmethod
-    def get_installed_themes(cls):
-        for folder in os.listdir(THEMES_HOME):
-            theme = cls.get_theme_from_folder(folder)
-            if theme is None:
-                continue
-            yield theme
+    def invalidate_themes_cache(cls):
+        with cls._themes_cache_lock:
+            cls._themes_cache_dirty = True
 
     @classmethod
     def install_audio_themePackage(cls, theme_pack):
+        """Install the given theme package and return the installed theme."""
         identified_path = os.path.join(THEMES_HOME, uuid4().hex).lower()
-        with ZipFile(theme_pack, "r") as pack:
-            if pack.infolist()[0].is_dir():
-                # Legacy theme package
-                return cls._install_legacy(pack, identified_path)
-            pack.extractall(path=identified_path)
+        try:
+            with ZipFile(theme_pack, "r") as pack:
+                if pack.infolist()[0].is_dir():
+                    # Legacy theme package
+                    cls._install_legacy(pack, identified_path)
+                else:
+                    pack.extractall(path=identified_path)
+        finally:
+            cls.invalidate_themes_cache()
+        return cls.get_theme_from_folder(os.path.split(identified_path)[-1])
 
     @classmethod
     def _install_legacy(cls, pack, final_dst):
@@ -248,21 +286,26 @@ class AudioThemesHandler:
             theme_info["name"] = theme_name
             cls.write_info_file(info_file, theme_info)
 
-    @staticmethod
-    def remove_audio_theme(theme):
+    @classmethod
+    def remove_audio_theme(cls, theme):
         theme.deactivate()
         if theme.directory:
-            shutil.rmtree(theme.directory)
+            try:
+                shutil.rmtree(theme.directory)
+            finally:
+                cls._info_cache.pop(theme.info_file_path, None)
+                cls.invalidate_themes_cache()
 
     @staticmethod
     def load_info_file(info_file):
         with open(info_file, "r", encoding="utf8") as f:
             return json.load(f)
 
-    @staticmethod
-    def write_info_file(file_path, data):
+    @classmethod
+    def write_info_file(cls, file_path, data):
         with open(file_path, "w", encoding="utf8") as f:
             json.dump(data, f)
+        cls.invalidate_themes_cache()
 
     @staticmethod
     def make_zip_file(output_filename, source_dir):
@@ -3,11 +3,15 @@
 # Copyright (c) 2014-2019 Musharraf Omer
 # This file is covered by the GNU General Public License.
 
+import bisect
+import threading
 import wx
 import config
 import gui
+import systemUtils
 from gui import guiHelper
 from gui.settingsDialogs import SettingsPanel
+from logHandler import log
 from .handler import AudioThemesHandler, audiotheme_changed
 
 
@@ -15,116 +19,193 @@ import addonHandler
 
 addonHandler.initTranslation()
 
+# Control labels, translated once per session
+# Translators: label for the checkbox to enable or disable audio themes
+_LBL_ENABLE = _("Enable audio themes")
+# Translators: label for a combobox containing a list of installed audio themes
+_LBL_SELECT = _("Select theme:")
+# Translators: shown in the list of installed audio themes while it is being loaded
+_LBL_LOADING = _("Loading themes...")
+# Translators: label for a button to show info about an audio theme
+_LBL_ABOUT = _("&About")
+# Translators: label for a button to remove an audio theme
+_LBL_REMOVE = _("&Remove")
+# Translators: label for a button to add a new audio theme
+_LBL_ADD = _("Add &New...")
+# Translators: label for a checkbox to toggle the 3D mode
+_LBL_PLAY_3D = _("Play sounds in 3D mode")
+# Translators: label for a checkbox to toggle the speaking of object role
+_LBL_SPEAK_ROLES = _("Speak roles such as button, edit box, link etc.")
+# Translators: label for a checkbox to toggle the use of audio themes during say all
+_LBL_SAY_ALL = _("Speak roles during say all")
+# Translators: label for a checkbox to toggle whether the volume of this add-on should follow the synthesizer volume
+_LBL_SYNTH_VOLUME = _("Use speech synthesizer volume")
+# Translators: label for a checkbox to toggle reverb effect
+_LBL_USE_REVERB = _("Use reverb effect")
+
 
 class AudioThemesSettingsPanel(SettingsPanel):
     # Translators: Title for the settings panel in NVDA's multi-category settings
     title = _("Audio Themes")
 
+    # Sliders as (attribute, label, minimum, maximum, configuration key, default value)
+    _VOLUME_SLIDER_SPECS = (
+        # Translators: label for a slider to set the volume of this add-on
+        ("volumeSlider", _("Audio themes volume:"), 0, 100, "volume", 100),
+    )
+    # Reverb sliders, created on demand
+    _REVERB_SLIDER_SPECS = (
+        # Translators: label for room size slider
+        ("roomSizeSlider", _("Room size (0-100):"), 0, 100, "RoomSize", 10),
+        # Translators: label for damping slider
+        ("dampingSlider", _("Damping (0-100):"), 0, 100, "Damping", 100),
+        # Translators: label for wet level slider
+        ("wetLevelSlider", _("Wet level (0-100):"), 0, 100, "WetLevel", 9),
+        # Translators: label for dry level slider
+        ("dryLevelSlider", _("Dry level (0-100):"), 0, 100, "DryLevel", 30),
+        # Translators: label for width slider
+        ("widthSlider", _("Width (0-100):"), 0, 100, "Width", 100),
+    )
+    # Reverb sliders and the configuration keys they edit
+    _REVERB_SLIDERS = tuple(
+        (attr, key, default) for attr, label, minimum, maximum, key, default in _REVERB_SLIDER_SPECS
+    )
+    # Every control holding a setting, with its configuration key and default value
+    _FIELDS = (
+        ("enableThemesCheckbox", "enable_audio_themes", True),
+        ("play3dCheckbox", "audio3d", True),
+        ("speakRoleCheckbox", "speak_roles", False),
+        ("useInSayAllCheckbox", "use_in_say_all", True),
+        ("useSynthVolumeCheckbox", "use_synth_volume", True),
+        ("volumeSlider", "volume", 100),
+        ("useReverbCheckbox", "use_reverb", True),
+        *_REVERB_SLIDERS,
+    )
+    # Controls enabled only while audio themes are enabled
+    _TOGGLEABLE_ATTRS = (
+        "installedThemesChoice",
+        "play3dCheckbox",
+        "speakRoleCheckbox",
+        "useInSayAllCheckbox",
+        "useSynthVolumeCheckbox",
+        "volumeSlider",
+        "useReverbCheckbox",
+        *(attr for attr, key, default in _REVERB_SLIDERS),
+        "aboutThemeButton",
+        "removeThemeButton",
+        "addThemeButton",
+    )
+
     def makeSettings(self, settingsSizer):
-        sHelper = guiHelper.BoxSizerHelper(self, sizer=settingsSizer)
+        self._conf = config.conf["audiothemes"]
+        self._sHelper = sHelper = guiHelper.BoxSizerHelper(self, sizer=settingsSizer)
+        self._buildCoreControls(sHelper)
+        self._controlsEnabled = None
+        self._lastThemesHash = None
+        self._cachedSelectedTheme = None
+        self.audio_themes = []
+        # Counts background rescans, so that only the latest one is applied
+        self._revalidations = 0
+        # Whether settings or installed themes changed, so the handler needs to reconfigure
+        self._dirty = False
+        self.reverbControlsBuilt = False
+        if self._conf.get("use_reverb", True):
+            self._buildReverbControls(sHelper)
+        else:
+            self.useReverbCheckbox.Bind(wx.EVT_CHECKBOX, self.onUseReverbChanged)
+        self._collectToggleableControls()
+
+        # Bind events
+        self.aboutThemeButton.Bind(wx.EVT_BUTTON, self.onAbout)
+        self.removeThemeButton.Bind(wx.EVT_BUTTON, self.onRemove)
+        self.addThemeButton.Bind(wx.EVT_BUTTON, self.onAdd)
+        self.enableThemesCheckbox.Bind(wx.EVT_CHECKBOX, self.onEnableChanged)
+        self.useSynthVolumeCheckbox.Bind(wx.EVT_CHECKBOX, self.onSynthVolumeChanged)
+        self.installedThemesChoice.Bind(wx.EVT_CHOICE, self.onThemeSelectionChanged)
+
+        self._initialize_at_state()
+        # Scanning the installed themes waits until the panel has been shown
+        self.installedThemesChoice.SetItems([_LBL_LOADING])
+        self.installedThemesChoice.SetSelection(0)
+        self.onThemeSelectionChanged(None)
+        wx.CallAfter(self._deferred_maintain_state)
 
-        # Translators: label for the checkbox to enable or disable audio themes
+    def _buildCoreControls(self, sHelper):
         self.enableThemesCheckbox = sHelper.addItem(
-            wx.CheckBox(self, label=_("Enable audio themes"))
+            wx.CheckBox(self, label=_LBL_ENABLE)
         )
 
-        # Translators: label for a combobox containing a list of installed audio themes
         self.installedThemesChoice = sHelper.addLabeledControl(
-            _("Select theme:"), wx.Choice, choices=[]
+            _LBL_SELECT, wx.Choice, choices=[]
         )
 
         # Theme action buttons
         bHelper = sHelper.addItem(guiHelper.ButtonHelper(wx.HORIZONTAL))
-        # Translators: label for a button to show info about an audio theme
-        self.aboutThemeButton = bHelper.addButton(self, label=_("&About"))
-        # Translators: label for a button to remove an audio theme
-        self.removeThemeButton = bHelper.addButton(self, label=_("&Remove"))
-        # Translators: label for a button to add a new audio theme
-        self.addThemeButton = bHelper.addButton(self, label=_("Add &New..."))
-
-        # Translators: label for a checkbox to toggle the 3D mode
+        self.aboutThemeButton = bHelper.addButton(self, label=_LBL_ABOUT)
+        self.removeThemeButton = bHelper.addButton(self, label=_LBL_REMOVE)
+        self.addThemeButton = bHelper.addButton(self, label=_LBL_ADD)
+
         self.play3dCheckbox = sHelper.addItem(
-            wx.CheckBox(self, label=_("Play sounds in 3D mode"))
+            wx.CheckBox(self, label=_LBL_PLAY_3D)
         )
 
-        # Translators: label for a checkbox to toggle the speaking of object role
         self.speakRoleCheckbox = sHelper.addItem(
-            wx.CheckBox(self, label=_("Speak roles such as button, edit box, link etc."))
+            wx.CheckBox(self, label=_LBL_SPEAK_ROLES)
         )
 
-        # Translators: label for a checkbox to toggle the use of audio themes during say all
         self.useInSayAllCheckbox = sHelper.addItem(
-            wx.CheckBox(self, label=_("Speak roles during say all"))
+            wx.CheckBox(self, label=_LBL_SAY_ALL)
         )
 
-        # Translators: label for a checkbox to toggle whether the volume of this add-on should follow the synthesizer volume
         self.useSynthVolumeCheckbox = sHelper.addItem(
-            wx.CheckBox(self, label=_("Use speech synthesizer volume"))
+            wx.CheckBox(self, label=_LBL_SYNTH_VOLUME)
         )
 
-        # Translators: label for a slider to set the volume of this add-on
-        self.volumeSlider = sHelper.addLabeledControl(
-            _("Audio themes volume:"),
-            wx.Slider,
-            minValue=0,
-            maxValue=100
-        )
+        self._addSliders(sHelper, self._VOLUME_SLIDER_SPECS)
 
-        # Translators: label for a checkbox to toggle reverb effect
         self.useReverbCheckbox = sHelper.addItem(
-            wx.CheckBox(self, label=_("Use reverb effect"))
+            wx.CheckBox(self, label=_LBL_USE_REVERB)
         )
 
-        # Translators: label for room size slider
-        self.roomSizeSlider = sHelper.addLabeledControl(
-            _("Room size (0-100):"),
-            wx.Slider,
-            minValue=0,
-            maxValue=100
+    def _buildReverbControls(self, sHelper):
+        """Create the reverb sliders, only needed once reverb is in use."""
+        self._addSliders(sHelper, self._REVERB_SLIDER_SPECS)
+        self.reverbControlsBuilt = True
+
+    def _collectToggleableControls(self):
+        """Resolve the controls toggled with audio themes, call after creating any of them."""
+        # The reverb sliders may not have been created yet
+        self._toggleableControls = tuple(
+            ctrl
+            for ctrl in (getattr(self, attr, None) for attr in self._TOGGLEABLE_ATTRS)
+            if ctrl is not None
         )
 
-        # Translators: label for damping slider
-        self.dampingSlider = sHelper.addLabeledControl(
-            _("Damping (0-100):"),
-            wx.Slider,
-            minValue=0,
-            maxValue=100
-        )
-
-        # Translators: label for wet level slider
-        self.wetLevelSlider = sHelper.addLabeledControl(
-            _("Wet level (0-100):"),
-            wx.Slider,
-            minValue=0,
-            maxValue=100
-        )
-
-        # Translators: label for dry level slider
-        self.dryLevelSlider = sHelper.addLabeledControl(
-            _("Dry level (0-100):"),
-            wx.Slider,
-            minValue=0,
-            maxValue=100
-        )
-
-        # Translators: label for width slider
-        self.widthSlider = sHelper.addLabeledControl(
-            _("Width (0-100):"),
-            wx.Slider,
-            minValue=0,
-            maxValue=100
-        )
-
-        # Bind events
-        self.aboutThemeButton.Bind(wx.EVT_BUTTON, self.onAbout)
-        self.removeThemeButton.Bind(wx.EVT_BUTTON, self.onRemove)
-        self.addThemeButton.Bind(wx.EVT_BUTTON, self.onAdd)
-        self.enableThemesCheckbox.Bind(wx.EVT_CHECKBOX, self.onEnableChanged)
-        self.useSynthVolumeCheckbox.Bind(wx.EVT_CHECKBOX, self.onSynthVolumeChanged)
-        self.installedThemesChoice.Bind(wx.EVT_CHOICE, self.onThemeSelectionChanged)
-
-        self._initialize_at_state()
-        self._maintain_state()
+    def _addSliders(self, sHelper, specs):
+        """Create a labeled slider for each spec, with a single repaint."""
+        self.Freeze()
+        try:
+            for attr, label, minimum, maximum, key, default in specs:
+                slider = sHelper.addLabeledControl(
+                    label, wx.Slider, minValue=minimum, maxValue=maximum
+                )
+                setattr(self, attr, slider)
+        finally:
+            self.Thaw()
+
+    def onUseReverbChanged(self, event):
+        event.Skip()
+        if self.reverbControlsBuilt or not self.useReverbCheckbox.IsChecked():
+            return
+        self.useReverbCheckbox.Unbind(wx.EVT_CHECKBOX, handler=self.onUseReverbChanged)
+        self._buildReverbControls(self._sHelper)
+        self._collectToggleableControls()
+        self._load_fields(self._REVERB_SLIDERS)
+        enabled = self.enableThemesCheckbox.IsChecked()
+        for attr, key, default in self._REVERB_SLIDERS:
+            getattr(self, attr).Enable(enabled)
+        self.settingsSizer.Layout()
+        self._sendLayoutUpdatedEvent()
 
     def onEnableChanged(self, event):
         enabled = self.enableThemesCheckbox.IsChecked()
@@ -135,88 +216,127 @@ class AudioThemesSettingsPanel(SettingsPanel):
 
     def _updateControlsState(self, enabled):
         """Enable/disable controls based on whether audio themes are enabled."""
-        for ctrl in (
-            self.installedThemesChoice,
-            self.play3dCheckbox,
-            self.speakRoleCheckbox,
-            self.useInSayAllCheckbox,
-            self.useSynthVolumeCheckbox,
-            self.volumeSlider,
-            self.useReverbCheckbox,
-            self.roomSizeSlider,
-            self.dampingSlider,
-            self.wetLevelSlider,
-            self.dryLevelSlider,
-            self.widthSlider,
-            self.aboutThemeButton,
-            self.removeThemeButton,
-            self.addThemeButton,
-        ):
-            ctrl.Enable(enabled)
+        if enabled != self._controlsEnabled:
+            self._controlsEnabled = enabled
+            # Repaint once for all controls
+            self.Freeze()
+            try:
+                for ctrl in self._toggleableControls:
+                    if ctrl.IsThisEnabled() != enabled:
+                        ctrl.Enable(enabled)
+            finally:
+                self.Thaw()
         if enabled:
             self.volumeSlider.Enable(not self.useSynthVolumeCheckbox.IsChecked())
             self.onThemeSelectionChanged(None)
 
     @property
     def selected_theme(self):
+        return self._cachedSelectedTheme
+
+    def _update_selected_theme(self):
+        """Read the selected theme from the choice, call whenever the selection may have changed."""
         selection = self.installedThemesChoice.GetSelection()
         if selection != wx.NOT_FOUND:
-            return self.installedThemesChoice.GetClientData(selection)
+            self._cachedSelectedTheme = self.installedThemesChoice.GetClientData(selection)
+        else:
+            self._cachedSelectedTheme = None
 
     def _initialize_at_state(self):
-        conf = config.conf["audiothemes"]
-        self.enableThemesCheckbox.SetValue(conf["enable_audio_themes"])
-        self.play3dCheckbox.SetValue(conf["audio3d"])
-        self.speakRoleCheckbox.SetValue(conf["speak_roles"])
-        self.useInSayAllCheckbox.SetValue(conf["use_in_say_all"])
-        self.useSynthVolumeCheckbox.SetValue(conf["use_synth_volume"])
-        self.volumeSlider.SetValue(conf["volume"])
-        self.useReverbCheckbox.SetValue(conf.get("use_reverb", True))
-        self.roomSizeSlider.SetValue(conf.get("RoomSize", 10))
-        self.dampingSlider.SetValue(conf.get("Damping", 100))
-        self.wetLevelSlider.SetValue(conf.get("WetLevel", 9))
-        self.dryLevelSlider.SetValue(conf.get("DryLevel", 30))
-        self.widthSlider.SetValue(conf.get("Width", 100))
-
-    def _maintain_state(self):
-        self.audio_themes = sorted(AudioThemesHandler.get_installed_themes())
-        self.installedThemesChoice.Clear()
-        for theme in self.audio_themes:
-            self.installedThemesChoice.Append(theme.name, theme)
+        self._load_fields(self._FIELDS)
+
+    def _load_fields(self, fields):
+        """Show the stored value of each of the given fields in its control."""
+        conf = self._conf
+        for attr, key, default in fields:
+            # The reverb sliders may not have been created yet
+            ctrl = getattr(self, attr, None)
+            if ctrl is not None:
+                ctrl.SetValue(conf.get(key, default))
+
+    def _deferred_maintain_state(self):
+        # The panel may have been closed before the call ran
+        if self:
+            self._maintain_state()
+
+    def _maintain_state(self, themes=None):
+        if themes is None:
+            themes = AudioThemesHandler.get_installed_themes()
+        choice = self.installedThemesChoice
+        # Only repopulate the choice when the listed themes changed
+        themes_hash = hash(tuple((theme.folder, theme.name) for theme in themes))
+        if themes_hash != self._lastThemesHash:
+            self.audio_themes = themes
+            self._lastThemesHash = themes_hash
+            self._themeIndexes = {theme.folder: i for i, theme in enumerate(themes)}
+            choice.Freeze()
+            try:
+                choice.SetItems([theme.name for theme in themes])
+                for i, theme in enumerate(themes):
+                    choice.SetClientData(i, theme)
+            finally:
+                choice.Thaw()
         # Select the active theme
-        for i, theme in enumerate(self.audio_themes):
-            if theme.folder == config.conf["audiothemes"]["active_theme"]:
-                self.installedThemesChoice.SetSelection(i)
-                break
+        choice.SetSelection(self._themeIndexes.get(self._conf["active_theme"], wx.NOT_FOUND))
+        self._update_selected_theme()
         self._updateControlsState(self.enableThemesCheckbox.IsChecked())
 
+    def _show_then_revalidate(self, themes):
+        """Show the locally updated themes right away, then confirm them with a rescan in the background."""
+        self._maintain_state(themes)
+        self._revalidations += 1
+        threading.Thread(
+            target=self._revalidate_themes,
+            args=(self._revalidations,),
+            name="audiothemes-rescan",
+            daemon=True,
+        ).start()
+
+    def _revalidate_themes(self, revalidation):
+        try:
+            themes = AudioThemesHandler.get_installed_themes(force=True)
+        except Exception:
+            # e.g. a half-extracted or malformed info file, never let it kill the thread silently
+            log.error("Failed to rescan the installed audio themes", exc_info=True)
+            return
+        wx.CallAfter(self._on_themes_revalidated, revalidation, themes)
+
+    def _on_themes_revalidated(self, revalidation, themes):
+        # The panel may have been closed, or a newer rescan started, in the meantime
+        if self and revalidation == self._revalidations:
+            self._maintain_state(themes)
+
     def onSave(self):
-        conf = config.conf["audiothemes"]
-        conf["enable_audio_themes"] = self.enableThemesCheckbox.IsChecked()
-        if self.selected_theme:
-            conf["active_theme"] = self.selected_theme.folder
-        conf["audio3d"] = self.play3dCheckbox.IsChecked()
-        conf["speak_roles"] = self.speakRoleCheckbox.IsChecked()
-        conf["use_in_say_all"] = self.useInSayAllCheckbox.IsChecked()
-        conf["use_synth_volume"] = self.useSynthVolumeCheckbox.IsChecked()
-        conf["volume"] = self.volumeSlider.GetValue()
-        conf["use_reverb"] = self.useReverbCheckbox.IsChecked()
-        conf["RoomSize"] = self.roomSizeSlider.GetValue()
-        conf["Damping"] = self.dampingSlider.GetValue()
-        conf["WetLevel"] = self.wetLevelSlider.GetValue()
-        conf["DryLevel"] = self.dryLevelSlider.GetValue()
-        conf["Width"] = self.widthSlider.GetValue()
+        conf = self._conf
+        updates = {}
+        for attr, key, default in self._FIELDS:
+            # Sliders that were never shown leave their settings untouched
+            ctrl = getattr(self, attr, None)
+            if ctrl is not None:
+                updates[key] = ctrl.GetValue()
+        selected_theme = self.selected_theme
+        if selected_theme:
+            updates["active_theme"] = selected_theme.folder
+        # Only write what changed, so that an unedited panel leaves the configuration untouched
+        for key, value in updates.items():
+            if conf.get(key) != value:
+                conf[key] = value
+                self._dirty = True
 
     def postSave(self):
-        audiotheme_changed.notify()
+        # Reloading the active theme is only needed when something changed
+        if self._dirty:
+            self._dirty = False
+            audiotheme_changed.notify()
 
     def onAbout(self, event):
-        if not self.selected_theme:
+        theme = self.selected_theme
+        if not theme:
             return
         wx.MessageBox(
             # Translators: content of a message box containing theme information
             _("Name: {name}\nAuthor: {author}\n\n{summary}").format(
-                **self.selected_theme.todict()
+                **theme.todict()
             ),
             # Translators: title for a message containing theme information
             _("About Audio Theme"),
@@ -238,7 +358,9 @@ class AudioThemesSettingsPanel(SettingsPanel):
         )
         if confirm == wx.YES:
             AudioThemesHandler.remove_audio_theme(theme)
-            self._maintain_state()
+            self._dirty = True
+            themes = [t for t in self.audio_themes if t is not theme]
+            self._show_then_revalidate(themes)
 
     def onAdd(self, event):
         openFileDlg = wx.FileDialog(
@@ -253,10 +375,44 @@ class AudioThemesSettingsPanel(SettingsPanel):
             filename = openFileDlg.GetPath().strip()
             openFileDlg.Destroy()
             if filename:
-                AudioThemesHandler.install_audio_themePackage(filename)
-                self._maintain_state()
+                self._install_theme(filename)
+
+    def _install_theme(self, filename):
+        """Install a theme package in the background, keeping the GUI responsive."""
+        progressDialog = gui.IndeterminateProgressDialog(
+            self,
+            # Translators: title of a dialog shown while an audio theme is being installed
+            _("Installing Audio Theme"),
+            # Translators: message shown while an audio theme is being installed
+            _("Please wait while the audio theme is being installed."),
+        )
+        theme = None
+        try:
+            theme = systemUtils.ExecAndPump(
+                AudioThemesHandler.install_audio_themePackage, filename
+            ).funcRes
+        except Exception:
+            log.error(f"Failed to install audio theme package {filename}", exc_info=True)
+            wx.MessageBox(
+                # Translators: message shown when an audio theme package could not be installed
+                _("Failed to install the audio theme from {path}.").format(path=filename),
+                # Translators: title of a message indicating an error
+                _("Error"),
+                style=wx.ICON_ERROR,
+            )
+        finally:
+            progressDialog.done()
+        self._dirty = True
+        if theme is None:
+            self._lastThemesHash = None
+            self._maintain_state()
+            return
+        themes = list(self.audio_themes)
+        bisect.insort(themes, theme)
+        self._show_then_revalidate(themes)
 
     def onThemeSelectionChanged(self, event):
+        self._update_selected_theme()
         flag = self.selected_theme is not None
         self.aboutThemeButton.Enable(flag)
         self.removeThemeButton.Enable(flag)
@@ -158,6 +158,11 @@ class ThemeBlenderDialog(BaseDialog):
         self.player = SteamAudioPlayer()
         super().__init__(title)
 
+    def Destroy(self):
+        # The preview player owns a worker thread, which keeps it alive until closed
+        self.player.close()
+        return super().Destroy()
+
     def addControls(self, sizer, parent):
         # Translators: label for a list containing theme's audio files
         themeEntriesLabel = wx.StaticText(parent, -1, _("Theme Sounds"))